@@ -2,6 +2,9 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
+from operator_mapping import apply_operator_mapping
+from snapshots import compare_snapshots, get_leistungskategorie, list_snapshots
+
 # --- SEITENKONFIGURATION & FARBPALETTE ---
 st.set_page_config(
     page_title="Ladeinfrastruktur in Deutschland | NOW GmbH",
@@ -24,11 +27,10 @@ def load_data():
         df['Jahr'] = df['Inbetriebnahmedatum'].dt.year
         df.dropna(subset=['Inbetriebnahmedatum', 'Bundesland', 'KreisKreisfreieStadt'], inplace=True)
         
-        def get_leistungskategorie(leistung):
-            if leistung >= 150: return 'HPC-Laden (>= 150 kW)'
-            elif leistung > 22: return 'Schnellladen (> 22 kW)'
-            else: return 'Normalladen (<= 22 kW)'
-        df['Leistungskategorie'] = df['LadeleistungInKW'].apply(get_leistungskategorie)
+        df['Leistungskategorie'] = get_leistungskategorie(df['LadeleistungInKW'])
+
+        # Schreibweisen desselben Betreibers zusammenführen
+        df = apply_operator_mapping(df)
         
         return df
     except FileNotFoundError:
@@ -71,7 +73,12 @@ if df is not None:
         df_filtered = df_filtered[df_filtered['KreisKreisfreieStadt'].str.lower().str.contains(search_kreis, na=False)]
     
     if search_betreiber:
-        df_filtered = df_filtered[df_filtered['BetreiberBereinigt'].str.lower().str.contains(search_betreiber, na=False)]
+        # Treffer in einer Schreibweise liefern alle Ladepunkte des zugehörigen Betreibers
+        treffer = (
+            df_filtered['BetreiberBereinigt'].astype(str).str.lower().str.contains(search_betreiber, na=False) |
+            df_filtered['BetreiberKanonisch'].str.lower().str.contains(search_betreiber, na=False)
+        )
+        df_filtered = df_filtered[df_filtered['BetreiberKanonisch'].isin(df_filtered.loc[treffer, 'BetreiberKanonisch'].dropna())]
 
     # --- HAUPTSEITE ---
     st.title("Stand der Ladeinfrastruktur in Deutschland")
@@ -184,11 +191,67 @@ if df is not None:
         fig_kategorien = px.pie(kategorie_counts, names='Leistungskategorie', values='count', title='<b>Anteil der Ladepunkttypen</b>', color='Leistungskategorie', color_discrete_map=color_map_pie)
         st.plotly_chart(fig_kategorien, use_container_width=True, key="fig_kategorien")
     with col_detail2:
-        top_10_betreiber = df_filtered['BetreiberBereinigt'].value_counts().nlargest(10).reset_index()
-        fig_betreiber = px.bar(top_10_betreiber, x='count', y='BetreiberBereinigt', orientation='h', title='<b>Top 10 Betreiber</b>', labels={'count': 'Anzahl Ladepunkte', 'BetreiberBereinigt': 'Betreiber'}, color_discrete_sequence=[NOW_GRUEN])
+        top_10_betreiber = df_filtered['BetreiberKanonisch'].value_counts().nlargest(10).reset_index()
+        fig_betreiber = px.bar(top_10_betreiber, x='count', y='BetreiberKanonisch', orientation='h', title='<b>Top 10 Betreiber</b>', labels={'count': 'Anzahl Ladepunkte', 'BetreiberKanonisch': 'Betreiber'}, color_discrete_sequence=[NOW_GRUEN])
         fig_betreiber.update_layout(yaxis={'categoryorder':'total ascending'})
         st.plotly_chart(fig_betreiber, use_container_width=True, key="fig_betreiber")
 
+    # --- VERGLEICH ZWEIER REGISTERSTÄNDE ---
+    snapshots = list_snapshots()
+    if len(snapshots) >= 2:
+        st.divider()
+        st.header("Veränderung zwischen Registerständen")
+        st.markdown("Die Veränderungen werden aus vorberechneten Aggregaten der gespeicherten Stände ermittelt und berücksichtigen die Filter der Seitenleiste nicht.")
+
+        col_stand_alt, col_stand_neu = st.columns(2)
+        release_alt = col_stand_alt.selectbox("Vergleichsstand:", options=snapshots, index=len(snapshots) - 2)
+        release_neu = col_stand_neu.selectbox("Aktueller Stand:", options=snapshots, index=len(snapshots) - 1)
+
+        try:
+            delta_kreis = compare_snapshots(release_alt, release_neu, 'Kreis')
+            delta_betreiber = compare_snapshots(release_alt, release_neu, 'Betreiber')
+            delta_kategorie = compare_snapshots(release_alt, release_neu, 'Leistungskategorie')
+            delta_gesamt = compare_snapshots(release_alt, release_neu, 'Gesamt').iloc[0]
+        except ValueError as e:
+            st.warning(f"Die Stände können nicht verglichen werden: {e}")
+            delta_gesamt = None
+
+        if delta_gesamt is not None:
+            # Die Ladeleistung ist hier die Summe über die Ladepunkte (LadeleistungInKW),
+            # nicht die installierte Leistung der Stationen aus den KPIs oben
+            col_delta1, col_delta2, col_delta3 = st.columns(3)
+            col_delta1.metric("Veränderung Ladestationen", f"{int(delta_gesamt['Delta_Ladestationen']):+,}".replace(',', '.'))
+            zu_abgang = None
+            if pd.notna(delta_gesamt['Zugang_Ladepunkte']):
+                zu_abgang = f"+{int(delta_gesamt['Zugang_Ladepunkte']):,} / -{int(delta_gesamt['Abgang_Ladepunkte']):,}".replace(',', '.')
+            col_delta2.metric("Veränderung Ladepunkte", f"{int(delta_gesamt['Delta_Ladepunkte']):+,}".replace(',', '.'), help=f"Zugang / Abgang: {zu_abgang}" if zu_abgang else None)
+            col_delta3.metric("Veränderung Ladeleistung der Ladepunkte", f"{delta_gesamt['Delta_LeistungKW'] / 1_000_000:+.2f} GW")
+
+            col_vergleich1, col_vergleich2 = st.columns(2)
+            with col_vergleich1:
+                if delta_kreis['Zugang_Ladepunkte'].notna().all():
+                    # Kreise mit den meisten Zu- und Abgängen; Abgänge werden nach links abgetragen,
+                    # damit sich gegenseitig aufhebende Änderungen sichtbar bleiben
+                    kreis_plot = delta_kreis.assign(Bewegung=delta_kreis['Zugang_Ladepunkte'] + delta_kreis['Abgang_Ladepunkte']).nlargest(15, 'Bewegung')
+                    kreis_plot = kreis_plot.assign(Zugang=kreis_plot['Zugang_Ladepunkte'], Abgang=-kreis_plot['Abgang_Ladepunkte'])
+                    fig_delta_kreis = px.bar(kreis_plot, x=['Zugang', 'Abgang'], y='Kreis', orientation='h', barmode='relative', title='<b>Zu- und Abgang von Ladepunkten nach Kreis</b>', labels={'value': 'Anzahl Ladepunkte', 'variable': '', 'Kreis': 'Landkreis/Stadt'}, color_discrete_sequence=[NOW_GRUEN, NOW_DUNKELBLAU])
+                    fig_delta_kreis.update_layout(yaxis={'categoryorder':'array', 'categoryarray': kreis_plot['Kreis'].iloc[::-1].tolist()})
+                else:
+                    # Ohne durchgehende Kette von Zwischenständen nur die Nettoveränderung
+                    kreis_plot = pd.concat([delta_kreis.head(10), delta_kreis.tail(5)]).drop_duplicates(subset='Kreis')
+                    fig_delta_kreis = px.bar(kreis_plot, x='Delta_Ladepunkte', y='Kreis', orientation='h', title='<b>Veränderung der Ladepunkte nach Kreis</b>', labels={'Delta_Ladepunkte': 'Veränderung Ladepunkte', 'Kreis': 'Landkreis/Stadt'}, color_discrete_sequence=[NOW_DUNKELBLAU])
+                    fig_delta_kreis.update_layout(yaxis={'categoryorder':'total ascending'})
+                st.plotly_chart(fig_delta_kreis, use_container_width=True, key="fig_delta_kreis")
+            with col_vergleich2:
+                top_10_wachstum = delta_betreiber.head(10)
+                fig_delta_betreiber = px.bar(top_10_wachstum, x='Delta_Ladepunkte', y='Betreiber', orientation='h', title='<b>Top 10 Betreiber nach Zubau</b>', labels={'Delta_Ladepunkte': 'Veränderung Ladepunkte'}, color_discrete_sequence=[NOW_GRUEN])
+                fig_delta_betreiber.update_layout(yaxis={'categoryorder':'total ascending'})
+                st.plotly_chart(fig_delta_betreiber, use_container_width=True, key="fig_delta_betreiber")
+
+            color_map_delta = {'HPC-Laden (>= 150 kW)': NOW_GRUEN, 'Schnellladen (> 22 kW)': NOW_DUNKELBLAU, 'Normalladen (<= 22 kW)': NOW_GRAU}
+            fig_delta_kategorie = px.bar(delta_kategorie, x='Leistungskategorie', y='Delta_Ladepunkte', title='<b>Veränderung der Ladepunkte nach Leistung</b>', labels={'Delta_Ladepunkte': 'Veränderung Ladepunkte'}, color='Leistungskategorie', color_discrete_map=color_map_delta)
+            st.plotly_chart(fig_delta_kategorie, use_container_width=True, key="fig_delta_kategorie")
+
     # --- ABSCHNITT LIMITATIONEN ---
     st.divider()
     st.header("Limitationen")
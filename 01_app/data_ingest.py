@@ -0,0 +1,254 @@
+# data_ingest.py
+#
+# Speicherbegrenzter Import der Rohdaten aus dem Ladesäulenregister.
+# Beide Faktentabellen werden in Blöcken (Chunks) gelesen, jeder Block wird mit
+# vektorisierten Regeln geprüft, fehlerhafte Zeilen landen mit Begründung in einer
+# Quarantäne-Datei und gültige Zeilen werden schrittweise in die Ausgabedatei geschrieben.
+#
+# Aufruf aus dem Projektordner:
+#   python 01_app/data_ingest.py
+
+import math
+import shutil
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+# --- PFADE & PARAMETER ---
+PROJECT_ROOT = Path(__file__).parent.parent
+ORIGINAL_DATA_DIR = PROJECT_ROOT / "02_data/01_original_data"
+COMPUTED_DATA_DIR = PROJECT_ROOT / "02_data/03_computed_data"
+
+LADESTATION_PATH = ORIGINAL_DATA_DIR / "ladestationFactTable.csv"
+LADEPUNKT_PATH = ORIGINAL_DATA_DIR / "ladepunktFactTable.csv"
+OUTPUT_PATH = COMPUTED_DATA_DIR / "combined_ladestation_ladepunkt.csv"
+QUARANTINE_DIR = COMPUTED_DATA_DIR / "quarantaene"
+
+# Anzahl Zeilen pro gelesenem Block. Die Anzahl der Partitionen für den Join wird so gewählt,
+# dass jede Partition einer Tabelle im Mittel höchstens einen Block groß ist.
+CHUNK_SIZE = 50_000
+
+# Grober Rahmen um Deutschland (wie in der Karte), um vertauschte oder falsche Koordinaten zu erkennen
+BREITENGRAD_RANGE = (47.0, 56.0)
+LAENGENGRAD_RANGE = (5.0, 16.0)
+
+
+# --- VALIDIERUNGSREGELN ---
+# Jede Regel bekommt einen Block (alle Spalten als Text) und liefert eine boolesche Maske
+# der Zeilen, die gegen die Regel verstoßen.
+def _ungueltige_id(chunk):
+    # Nur ganze Zahlen sind gültig, sonst würde z.B. "1.5" beim Umwandeln zu Station 1
+    ids = pd.to_numeric(chunk['ladestation_id'], errors='coerce')
+    return ids.isna() | (ids % 1 != 0)
+
+
+def _ungueltiges_datum(chunk):
+    return pd.to_datetime(chunk['Inbetriebnahmedatum'], format='%Y-%m-%d', errors='coerce').isna()
+
+
+def _fehlende_koordinaten(chunk):
+    breite = pd.to_numeric(chunk['Breitengrad'], errors='coerce')
+    laenge = pd.to_numeric(chunk['Laengengrad'], errors='coerce')
+    return breite.isna() | laenge.isna()
+
+
+def _koordinaten_ausserhalb(chunk):
+    breite = pd.to_numeric(chunk['Breitengrad'], errors='coerce')
+    laenge = pd.to_numeric(chunk['Laengengrad'], errors='coerce')
+    innerhalb = breite.between(*BREITENGRAD_RANGE) & laenge.between(*LAENGENGRAD_RANGE)
+    # Fehlende Werte werden bereits von '_fehlende_koordinaten' erfasst
+    return ~innerhalb & breite.notna() & laenge.notna()
+
+
+def _fehlende_region(chunk):
+    return chunk['Bundesland'].isna() | chunk['KreisKreisfreieStadt'].isna()
+
+
+def _ungueltige_ladeleistung(chunk):
+    leistung = pd.to_numeric(chunk['LadeleistungInKW'], errors='coerce')
+    return leistung.isna() | (leistung <= 0)
+
+
+LADESTATION_RULES = {
+    'ladestation_id ungültig': _ungueltige_id,
+    'Inbetriebnahmedatum nicht lesbar': _ungueltiges_datum,
+    'Koordinaten fehlen': _fehlende_koordinaten,
+    'Koordinaten außerhalb Deutschlands': _koordinaten_ausserhalb,
+    'Bundesland/Kreis fehlt': _fehlende_region,
+}
+
+LADEPUNKT_RULES = {
+    'ladestation_id ungültig': _ungueltige_id,
+    'LadeleistungInKW nicht numerisch oder <= 0': _ungueltige_ladeleistung,
+}
+
+# Gründe, die erst beim Zusammenführen beider Tabellen feststehen
+GRUND_KEINE_STATION = 'keine gültige Ladestation'
+GRUND_ALLE_PUNKTE_ABGELEHNT = 'alle Ladepunkte abgelehnt'
+
+
+def validate_chunk(chunk, rules):
+    # Wendet alle Regeln auf den Block an und trennt gültige von fehlerhaften Zeilen.
+    # Gibt (gültige Zeilen, Quarantäne-Zeilen mit Spalte 'Grund', Verstöße pro Regel) zurück.
+    violations = pd.DataFrame({name: rule(chunk) for name, rule in rules.items()}, index=chunk.index)
+    invalid = violations.any(axis=1)
+
+    quarantined = chunk[invalid].copy()
+    if not quarantined.empty:
+        # Alle verletzten Regeln einer Zeile als Text zusammenfassen
+        failed = violations[invalid]
+        quarantined['Grund'] = failed.dot(failed.columns + '; ').str.rstrip('; ')
+
+    valid = chunk[~invalid].copy()
+    valid['ladestation_id'] = pd.to_numeric(valid['ladestation_id']).astype('int64')
+    return valid, quarantined, violations.sum()
+
+
+def _count_rows(path):
+    # Schnelles Zählen der Datenzeilen ohne Parsen (Kopfzeile wird abgezogen)
+    with open(path, 'rb') as f:
+        lines = sum(buffer.count(b'\n') for buffer in iter(lambda: f.read(1 << 20), b''))
+    return max(lines - 1, 0)
+
+
+def _append_csv(df, path):
+    # Hängt einen Block an eine CSV-Datei an, die Kopfzeile wird nur beim ersten Mal geschrieben
+    df.to_csv(path, mode='a', header=not path.exists(), index=False)
+
+
+def _read_partition(path, columns):
+    # Liest eine Partitionsdatei; fehlt sie, wird eine leere Tabelle mit den Spalten zurückgegeben
+    if not path.exists():
+        return pd.DataFrame(columns=columns, dtype=str)
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+
+
+def _stream_table(source_path, rules, partition_dir, quarantine_path, chunk_size, n_partitions,
+                  rejected_dir=None):
+    # Liest eine Faktentabelle blockweise, prüft jeden Block und verteilt die gültigen
+    # Zeilen anhand der ladestation_id auf Partitionsdateien. Mit 'rejected_dir' werden
+    # zusätzlich die Stations-IDs abgelehnter Zeilen partitioniert abgelegt.
+    counts = pd.Series(0, index=list(rules), dtype='int64')
+    rows_total = 0
+
+    reader = pd.read_csv(source_path, sep=';', dtype=str, keep_default_na=False,
+                         na_values=[''], chunksize=chunk_size)
+    for chunk in reader:
+        rows_total += len(chunk)
+        valid, quarantined, violations = validate_chunk(chunk, rules)
+        counts += violations
+
+        if not quarantined.empty:
+            _append_csv(quarantined, quarantine_path)
+
+            if rejected_dir is not None:
+                rejected_ids = pd.to_numeric(quarantined['ladestation_id'], errors='coerce')
+                rejected_ids = rejected_ids[rejected_ids % 1 == 0].astype('int64').to_frame()
+                for part_id, part in rejected_ids.groupby(rejected_ids['ladestation_id'] % n_partitions):
+                    _append_csv(part, rejected_dir / f"part_{part_id}.csv")
+
+        partition = valid['ladestation_id'] % n_partitions
+        for part_id, part in valid.groupby(partition):
+            _append_csv(part, partition_dir / f"part_{part_id}.csv")
+
+    return rows_total, counts
+
+
+def run_ingest(ladestation_path=LADESTATION_PATH, ladepunkt_path=LADEPUNKT_PATH,
+               output_path=OUTPUT_PATH, quarantine_dir=QUARANTINE_DIR,
+               chunk_size=CHUNK_SIZE):
+    # Führt Validierung und Left-Join beider Tabellen aus, ohne eine der Tabellen komplett
+    # in den Speicher zu laden. Gibt eine Übersicht der Ablehnungen pro Regel zurück.
+    # Der Speicherbedarf liegt bei wenigen Blöcken: eine Stations- und eine Ladepunkt-Partition
+    # mit je etwa 'chunk_size' Zeilen sowie deren Join-Ergebnis.
+    output_path = Path(output_path)
+    quarantine_dir = Path(quarantine_dir)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    quarantine_dir.mkdir(parents=True, exist_ok=True)
+
+    # Ergebnisse eines früheren Laufs entfernen, da alle Dateien blockweise angehängt werden
+    quarantine_station_path = quarantine_dir / "quarantaene_ladestation.csv"
+    quarantine_punkt_path = quarantine_dir / "quarantaene_ladepunkt.csv"
+    for path in (output_path, quarantine_station_path, quarantine_punkt_path):
+        path.unlink(missing_ok=True)
+
+    # Partitionsanzahl aus der größeren der beiden Tabellen ableiten
+    n_partitions = max(1, math.ceil(max(_count_rows(ladestation_path), _count_rows(ladepunkt_path)) / chunk_size))
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="ladeinfrastruktur_ingest_"))
+    try:
+        station_dir = tmp_dir / "ladestation"
+        punkt_dir = tmp_dir / "ladepunkt"
+        rejected_dir = tmp_dir / "ladepunkt_abgelehnt"
+        station_dir.mkdir()
+        punkt_dir.mkdir()
+        rejected_dir.mkdir()
+
+        # 1. Beide Tabellen blockweise prüfen und partitionieren
+        station_rows, station_counts = _stream_table(
+            ladestation_path, LADESTATION_RULES, station_dir, quarantine_station_path, chunk_size, n_partitions
+        )
+        punkt_rows, punkt_counts = _stream_table(
+            ladepunkt_path, LADEPUNKT_RULES, punkt_dir, quarantine_punkt_path, chunk_size, n_partitions,
+            rejected_dir=rejected_dir
+        )
+        station_columns = list(pd.read_csv(ladestation_path, sep=';', nrows=0).columns)
+        punkt_columns = list(pd.read_csv(ladepunkt_path, sep=';', nrows=0).columns)
+        station_counts[GRUND_ALLE_PUNKTE_ABGELEHNT] = 0
+        punkt_counts[GRUND_KEINE_STATION] = 0
+
+        # 2. Partitionsweise zusammenführen (Left-Join wie im Notebook 00_data_merging)
+        # Da beide Seiten nach derselben ladestation_id partitioniert sind, liegen alle
+        # Ladepunkte einer Station in derselben Partition.
+        ladepunkt_offset = 0
+        for part_id in range(n_partitions):
+            df_stationen = _read_partition(station_dir / f"part_{part_id}.csv", station_columns)
+            df_punkte = _read_partition(punkt_dir / f"part_{part_id}.csv", punkt_columns)
+            rejected_ids = _read_partition(rejected_dir / f"part_{part_id}.csv", ['ladestation_id'])['ladestation_id']
+
+            # Ladepunkte ohne gültige Station würden beim Left-Join verschwinden
+            ohne_station = ~df_punkte['ladestation_id'].isin(df_stationen['ladestation_id'])
+            if ohne_station.any():
+                _append_csv(df_punkte[ohne_station].assign(Grund=GRUND_KEINE_STATION), quarantine_punkt_path)
+                punkt_counts[GRUND_KEINE_STATION] += int(ohne_station.sum())
+
+            # Stationen, deren Ladepunkte alle abgelehnt wurden, würden sonst mit leerer Ladeleistung
+            # als ein Ladepunkt erscheinen
+            alle_abgelehnt = (
+                df_stationen['ladestation_id'].isin(rejected_ids) &
+                ~df_stationen['ladestation_id'].isin(df_punkte['ladestation_id'])
+            )
+            if alle_abgelehnt.any():
+                _append_csv(df_stationen[alle_abgelehnt].assign(Grund=GRUND_ALLE_PUNKTE_ABGELEHNT), quarantine_station_path)
+                station_counts[GRUND_ALLE_PUNKTE_ABGELEHNT] += int(alle_abgelehnt.sum())
+                df_stationen = df_stationen[~alle_abgelehnt]
+
+            if df_stationen.empty:
+                continue
+
+            df_combined = pd.merge(df_stationen, df_punkte, on='ladestation_id', how='left')
+            df_combined['ladepunkt_id'] = range(ladepunkt_offset + 1, ladepunkt_offset + len(df_combined) + 1)
+            ladepunkt_offset += len(df_combined)
+
+            _append_csv(df_combined, output_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # 3. Ablehnungen pro Regel zusammenfassen
+    report = pd.concat([
+        pd.DataFrame({'Tabelle': 'ladestation', 'Regel': station_counts.index, 'Abgelehnt': station_counts.values}),
+        pd.DataFrame({'Tabelle': 'ladepunkt', 'Regel': punkt_counts.index, 'Abgelehnt': punkt_counts.values}),
+    ], ignore_index=True)
+
+    print(f"Ladestationen gelesen: {station_rows:,}")
+    print(f"Ladepunkte gelesen: {punkt_rows:,}")
+    print(f"Zeilen in '{output_path.name}': {ladepunkt_offset:,}")
+    print("Abgelehnte Zeilen pro Regel (eine Zeile kann mehrere Regeln verletzen):")
+    print(report.to_string(index=False))
+
+    return report
+
+
+if __name__ == "__main__":
+    run_ingest()
@@ -0,0 +1,253 @@
+# operator_mapping.py
+#
+# Zusammenführung unterschiedlicher Schreibweisen desselben Betreibers in 'BetreiberBereinigt'.
+# Die Namen werden normalisiert (Kleinschreibung, Umlaute, Rechtsformen, Satzzeichen), danach
+# werden ähnliche Namen über Zeichen-N-Gramme gefunden. Statt alle Namen paarweise zu
+# vergleichen, werden nur Paare bewertet, die mindestens ein seltenes N-Gramm teilen (Blocking).
+# Zusätzlich müssen die unterscheidenden Wörter (ohne "Stadtwerke", "Energie" usw.) übereinstimmen,
+# und jeder Name wird nur mit der häufigsten Schreibweise einer Gruppe verglichen, damit
+# z.B. "Stadtwerke Münster" und "Stadtwerke Neumünster" nicht über Zwischenschritte verschmelzen.
+# Die Zuordnung Name -> betreiber_id wird gespeichert und bei neuen Ständen nur für
+# unbekannte Namen erweitert, bestehende IDs bleiben unverändert.
+#
+# Aufruf aus dem Projektordner (nach data_ingest.py):
+#   python 01_app/operator_mapping.py
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_ingest import COMPUTED_DATA_DIR, OUTPUT_PATH
+
+# --- PFADE & PARAMETER ---
+MAPPING_PATH = COMPUTED_DATA_DIR / "betreiber_mapping.csv"
+MAPPING_COLUMNS = ['BetreiberBereinigt', 'betreiber_key', 'betreiber_id', 'BetreiberKanonisch']
+
+# Ab dieser Kosinus-Ähnlichkeit der N-Gramm-Vektoren gelten zwei Namen als derselbe Betreiber
+SIMILARITY_THRESHOLD = 0.8
+# N-Gramme, die in mehr Namen vorkommen, werden nicht zum Blocking verwendet (z.B. "wer" aus "werke")
+MAX_BLOCK_SIZE = 200
+
+LEGAL_FORMS = [
+    'gmbh', 'mbh', 'ag', 'se', 'kg', 'kgaa', 'ohg', 'gbr', 'ug', 'eg', 'ev', 'e v', 'co',
+    'haftungsbeschraenkt', 'ltd', 'limited', 'inc', 'bv', 'b v', 'sarl', 'srl', 'spa', 'aoer', 'kdoer',
+]
+# Häufige Wörter in Betreibernamen, die allein keinen Betreiber unterscheiden (normalisierte Form)
+COMMON_WORDS = [
+    'stadtwerk', 'stadtwerke', 'gemeindewerke', 'werke', 'energie', 'energien', 'energieversorgung',
+    'energieversorger', 'energiedienste', 'versorgung', 'versorgungsbetriebe', 'netz', 'netze', 'strom',
+    'stromversorgung', 'service', 'services', 'gruppe', 'group', 'holding', 'germany', 'deutschland',
+    'mobility', 'emobility', 'elektromobilitaet', 'charging', 'ladeinfrastruktur', 'solutions',
+    'und', 'der', 'die', 'das', 'fuer', 'von', 'am', 'an', 'im', 'in', 'zu', 'the', 'and', 'of',
+]
+UMLAUTE = {'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'}
+LEGAL_FORM_PATTERN = re.compile(r'\b(' + '|'.join(sorted(LEGAL_FORMS, key=len, reverse=True)) + r')\b')
+
+
+def normalize_name(name):
+    # Vergleichsschlüssel eines Betreibernamens; leerer Schlüssel fällt auf den Rohnamen zurück
+    raw = str(name).strip().lower()
+    key = raw
+    for umlaut, ersatz in UMLAUTE.items():
+        key = key.replace(umlaut, ersatz)
+    key = re.sub(r'[^a-z0-9]+', ' ', key)
+    key = LEGAL_FORM_PATTERN.sub(' ', key)
+    key = ' '.join(key.split())
+    return key or raw
+
+
+def load_mapping(mapping_path=MAPPING_PATH):
+    if not mapping_path.exists():
+        return pd.DataFrame(columns=MAPPING_COLUMNS)
+    # Wie in data_ingest.py gilt nur ein leeres Feld als fehlend, damit Betreiber wie "NA" oder
+    # "None" als Namen erhalten bleiben
+    return pd.read_csv(mapping_path, dtype={'BetreiberBereinigt': str, 'betreiber_key': str, 'BetreiberKanonisch': str},
+                       keep_default_na=False, na_values=[''])
+
+
+def _candidate_pairs(keys, is_new):
+    # Liefert Kandidatenpaare (i, j) mit ihrer Ähnlichkeit. Es werden nur Paare gebildet,
+    # an denen mindestens ein neuer Schlüssel beteiligt ist und deren unterscheidende Wörter
+    # übereinstimmen: die Wörter des kürzeren Namens müssen alle im längeren vorkommen.
+    # scikit-learn wird erst hier importiert, damit das Dashboard die Zuordnung ohne diese
+    # Abhängigkeit lesen kann
+    from scipy.sparse import csr_matrix
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 3))
+    tfidf = vectorizer.fit_transform(keys)
+
+    # Blocking: nur N-Gramme verwenden, die in höchstens MAX_BLOCK_SIZE Schlüsseln vorkommen
+    blocks = (tfidf > 0).astype(np.int32).tocsc()
+    block_sizes = np.diff(blocks.indptr)
+    blocks = blocks[:, block_sizes <= MAX_BLOCK_SIZE].tocsr()
+
+    new_idx = np.flatnonzero(is_new)
+    shared = (blocks[new_idx] @ blocks.T).tocoo()
+    i = new_idx[shared.row]
+    j = shared.col
+    # Jedes Paar nur einmal und nicht mit sich selbst bewerten
+    keep = (i != j) & (~is_new[j] | (i < j))
+    i, j = i[keep], j[keep]
+
+    # Unterscheidende Wörter je Schlüssel; besteht kein Name aus anderen als häufigen Wörtern,
+    # gibt es kein Paar
+    try:
+        words = CountVectorizer(binary=True, token_pattern=r'\S+', stop_words=COMMON_WORDS).fit_transform(keys)
+    except ValueError:
+        words = csr_matrix((len(keys), 1), dtype=np.int64)
+    n_words = np.asarray(words.sum(axis=1)).ravel()
+    common = np.asarray(words[i].multiply(words[j]).sum(axis=1)).ravel()
+    shorter = np.minimum(n_words[i], n_words[j])
+    keep = (shorter > 0) & (common == shorter)
+    i, j = i[keep], j[keep]
+
+    # Vektorisierte Kosinus-Ähnlichkeit der Kandidatenpaare (TF-IDF-Zeilen sind L2-normiert)
+    similarity = np.asarray(tfidf[i].multiply(tfidf[j]).sum(axis=1)).ravel()
+    return i, j, similarity
+
+
+def resolve_names(names, mapping, threshold=SIMILARITY_THRESHOLD):
+    # Ordnet alle in 'mapping' noch unbekannten Namen aus 'names' einer betreiber_id zu und gibt
+    # die erweiterte Zuordnung zurück, ohne sie zu speichern.
+    names = pd.Series(names).dropna().astype(str)
+    counts = names.value_counts()
+    unknown = counts[~counts.index.isin(mapping['BetreiberBereinigt'])]
+    if unknown.empty:
+        return mapping
+
+    new_names = pd.DataFrame({'BetreiberBereinigt': unknown.index, 'Anzahl': unknown.to_numpy()})
+    new_names['betreiber_key'] = new_names['BetreiberBereinigt'].map(normalize_name)
+
+    # 1. Gleicher Schlüssel wie ein bereits bekannter Name -> dessen ID übernehmen
+    known_keys = mapping.drop_duplicates('betreiber_key').set_index('betreiber_key')
+    new_names['betreiber_id'] = new_names['betreiber_key'].map(known_keys['betreiber_id'])
+
+    # 2. Ähnlichkeitssuche auf Ebene der eindeutigen Schlüssel. Bekannte Betreiber werden nur
+    # über ihren kanonischen Namen verglichen, neue Schlüssel nach Häufigkeit absteigend.
+    open_keys = (
+        new_names[new_names['betreiber_id'].isna()]
+        .groupby('betreiber_key')['Anzahl'].sum()
+        .sort_values(ascending=False, kind='stable')
+        .index.to_numpy(dtype=str)
+    )
+    if len(open_keys) > 0:
+        representatives = mapping[mapping['BetreiberBereinigt'] == mapping['BetreiberKanonisch']]
+        representatives = representatives.drop_duplicates('betreiber_id')
+        keys = np.concatenate([representatives['betreiber_key'].to_numpy(dtype=str), open_keys])
+        key_ids = np.concatenate([representatives['betreiber_id'].to_numpy(dtype=float), np.full(len(open_keys), np.nan)])
+        is_new = np.isnan(key_ids)
+
+        i, j, similarity = _candidate_pairs(keys, is_new)
+        match = similarity >= threshold
+        i, j, similarity = i[match], j[match], similarity[match]
+
+        # Ähnlichster bekannter Betreiber je neuem Schlüssel
+        known_pairs = ~is_new[j]
+        known_matches = pd.DataFrame({
+            'key': i[known_pairs], 'betreiber_id': key_ids[j[known_pairs]], 'similarity': similarity[known_pairs],
+        })
+        best_match = known_matches.sort_values('similarity').groupby('key')['betreiber_id'].last()
+        key_ids[best_match.index.to_numpy()] = best_match.to_numpy()
+
+        # Übrige neue Schlüssel schließen sich der ähnlichsten häufigeren Schreibweise an, die
+        # selbst eine Gruppe anführt; sonst eröffnen sie eine eigene Gruppe mit neuer ID. Da nur
+        # mit dem Anführer verglichen wird, entstehen keine Ketten über Zwischenschritte.
+        new_pairs = pd.DataFrame({'a': i[~known_pairs], 'b': j[~known_pairs], 'similarity': similarity[~known_pairs]})
+        neighbours = pd.concat([new_pairs, new_pairs.rename(columns={'a': 'b', 'b': 'a'})]).groupby('a')
+        neighbours = {key: (group['b'].to_numpy(), group['similarity'].to_numpy()) for key, group in neighbours}
+
+        leader = {}
+        next_id = int(mapping['betreiber_id'].max()) + 1 if not mapping.empty else 1
+        for key in np.flatnonzero(is_new & np.isnan(key_ids)):
+            other, other_similarity = neighbours.get(key, (np.empty(0, dtype=int), np.empty(0)))
+            is_leader = np.array([leader.get(o) == o for o in other], dtype=bool)
+            if is_leader.any():
+                best = other[is_leader][np.argmax(other_similarity[is_leader])]
+                leader[key] = best
+                key_ids[key] = key_ids[best]
+            else:
+                leader[key] = key
+                key_ids[key] = next_id
+                next_id += 1
+
+        open_key_ids = pd.Series(key_ids[is_new], index=keys[is_new])
+        still_open = new_names['betreiber_id'].isna()
+        new_names.loc[still_open, 'betreiber_id'] = new_names.loc[still_open, 'betreiber_key'].map(open_key_ids)
+
+    new_names['betreiber_id'] = new_names['betreiber_id'].astype('int64')
+
+    # 3. Kanonischer Name: bestehender Name der ID oder häufigste Schreibweise einer neuen Gruppe
+    canonical = mapping.drop_duplicates('betreiber_id').set_index('betreiber_id')['BetreiberKanonisch']
+    most_frequent = new_names.sort_values('Anzahl', ascending=False).drop_duplicates('betreiber_id')
+    canonical = canonical.combine_first(most_frequent.set_index('betreiber_id')['BetreiberBereinigt'])
+    new_names['BetreiberKanonisch'] = new_names['betreiber_id'].map(canonical)
+
+    mapping = pd.concat([mapping, new_names.drop(columns='Anzahl')], ignore_index=True)
+    mapping['betreiber_id'] = mapping['betreiber_id'].astype('int64')
+    return mapping
+
+
+def update_mapping(names, mapping_path=MAPPING_PATH, threshold=SIMILARITY_THRESHOLD):
+    # Erweitert die gespeicherte Zuordnung um alle noch unbekannten Namen aus 'names'
+    # und gibt die vollständige Zuordnung zurück.
+    mapping = load_mapping(mapping_path)
+    known = len(mapping)
+    mapping = resolve_names(names, mapping, threshold)
+    if len(mapping) == known:
+        return mapping
+
+    mapping_path.parent.mkdir(parents=True, exist_ok=True)
+    mapping.to_csv(mapping_path, index=False)
+
+    print(f"{len(mapping) - known:,} neue Schreibweisen zugeordnet, {mapping['betreiber_id'].nunique():,} Betreiber insgesamt.")
+    return mapping
+
+
+# --- REGRESSIONSPRÜFUNG ---
+# Namenspaare, die zusammengeführt bzw. getrennt bleiben müssen
+MUST_MERGE = [
+    ('Ionity GmbH', 'IONITY'),
+    ('Tesla Germany', 'Tesla Germany GmbH'),
+    ('Stadtwerke München GmbH', 'SWM Stadtwerke München'),
+    ('EnBW Energie Baden-Württemberg AG', 'EnBW Energie Baden-Wuerttemberg'),
+]
+MUST_NOT_MERGE = [
+    ('Stadtwerke Münster', 'Stadtwerke Neumünster'),
+    ('Stadtwerke Halle', 'Stadtwerke Hallein'),
+    ('Stadtwerke Ulm', 'Stadtwerke Ulmen'),
+    ('Stadtwerke Bremen', 'Stadtwerke Bremerhaven'),
+    ('Stadtwerke Neuss', 'Stadtwerke Neustadt'),
+    ('Stadtwerke Esslingen', 'Stadtwerke Lingen'),
+    ('Stadtwerke Lingen', 'Stadtwerke Linden'),
+    ('Stadtwerke Esslingen', 'Stadtwerke Linden'),
+]
+
+
+def check_resolution(threshold=SIMILARITY_THRESHOLD):
+    # Ordnet die Beispielnamen gemeinsam einer leeren Zuordnung zu und meldet jedes Paar,
+    # das falsch zusammengeführt oder getrennt wurde
+    names = pd.Series([name for pair in MUST_MERGE + MUST_NOT_MERGE for name in pair])
+    mapping = resolve_names(names, pd.DataFrame(columns=MAPPING_COLUMNS), threshold)
+    ids = mapping.set_index('BetreiberBereinigt')['betreiber_id']
+
+    errors = [f"nicht zusammengeführt: {a} / {b}" for a, b in MUST_MERGE if ids[a] != ids[b]]
+    errors += [f"fälschlich zusammengeführt: {a} / {b}" for a, b in MUST_NOT_MERGE if ids[a] == ids[b]]
+    if errors:
+        raise ValueError("Betreiberzuordnung fehlerhaft:\n" + "\n".join(errors))
+
+
+def apply_operator_mapping(df, mapping_path=MAPPING_PATH):
+    # Ergänzt 'betreiber_id' und 'BetreiberKanonisch' aus der gespeicherten Zuordnung, ohne sie
+    # zu verändern. Namen, die (noch) nicht zugeordnet sind, behalten ihre eigene Schreibweise.
+    mapping = load_mapping(mapping_path).set_index('BetreiberBereinigt')
+    namen = df['BetreiberBereinigt'].where(df['BetreiberBereinigt'].isna(), df['BetreiberBereinigt'].astype(str))
+    df['betreiber_id'] = namen.map(mapping['betreiber_id']).astype('Int64')
+    df['BetreiberKanonisch'] = namen.map(mapping['BetreiberKanonisch']).fillna(namen)
+    return df
+
+
+if __name__ == "__main__":
+    check_resolution()
+    update_mapping(pd.read_csv(OUTPUT_PATH, usecols=['BetreiberBereinigt'], dtype=str)['BetreiberBereinigt'])
@@ -0,0 +1,336 @@
+# snapshots.py
+#
+# Versionierte Stände (Snapshots) des Ladesäulenregisters.
+# Jede Zeile der kombinierten Tabelle wird über einen Hash ihres Inhalts identifiziert und nur
+# einmal im gemeinsamen Zeilenspeicher abgelegt. Ein Snapshot besteht aus einem Manifest
+# (welche Zeilen gehören zu diesem Stand) und vorberechneten Aggregaten je Kreis, Betreiber
+# und Leistungskategorie. Unveränderte Zeilen werden so zwischen den Ständen geteilt und
+# Vergleiche zweier Stände benötigen nur die kleinen Aggregat-Dateien.
+#
+# Aufruf aus dem Projektordner (nach data_ingest.py):
+#   python 01_app/snapshots.py
+
+import numpy as np
+import pandas as pd
+
+from data_ingest import CHUNK_SIZE, OUTPUT_PATH, PROJECT_ROOT
+from operator_mapping import MAPPING_PATH, update_mapping
+
+# --- PFADE & PARAMETER ---
+SNAPSHOT_DIR = PROJECT_ROOT / "02_data/04_snapshots"
+ROW_STORE_NAME = "zeilen.csv"
+MANIFEST_NAME = "manifest.csv"
+AGGREGATE_NAME = "aggregate.csv"
+
+CHANGES_NAME = "veraenderung.csv"
+
+# Spalten, die sich mit jeder Veröffentlichung ändern, ohne dass sich die Station ändert.
+# Sie gehen nicht in den Zeilen-Hash ein und werden nicht im Zeilenspeicher abgelegt.
+VOLATILE_COLUMNS = ['ladepunkt_id', 'Datenstand', 'Datenstand_x', 'Datenstand_y']
+
+# Version der Aggregat-Dateien. Stände mit abweichender Version werden nicht verglichen,
+# sondern müssen mit 'rebuild_aggregates' neu berechnet werden.
+#   1: Betreiber nach Schreibweise in 'BetreiberBereinigt', ohne 'Gesamt'
+#   2: Betreiber nach kanonischem Namen aus operator_mapping.py, mit 'Gesamt'
+#   3: zusätzlich Zu- und Abgänge von Ladepunkten gegenüber dem vorherigen Stand
+AGGREGATE_VERSION = 3
+
+# Dimensionen, für die Aggregate vorberechnet werden. 'Gesamt' enthält eine einzige Zeile und
+# zählt jede Station genau einmal, auch wenn ihre Ladepunkte in mehrere Kategorien fallen.
+DIMENSIONS = {
+    'Gesamt': 'Gesamt',
+    'Kreis': 'KreisKreisfreieStadt',
+    'Betreiber': 'BetreiberKanonisch',
+    'Leistungskategorie': 'Leistungskategorie',
+}
+
+
+def get_leistungskategorie(leistung):
+    # Leistungskategorie je Ladepunkt; wird auch vom Dashboard verwendet, damit Snapshots
+    # und Live-Ansicht dieselben Grenzen nutzen
+    return pd.Series(
+        np.select(
+            [leistung >= 150, leistung > 22],
+            ['HPC-Laden (>= 150 kW)', 'Schnellladen (> 22 kW)'],
+            default='Normalladen (<= 22 kW)'
+        ),
+        index=leistung.index
+    )
+
+
+def list_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    # Alle gespeicherten Stände, aufsteigend sortiert
+    if not snapshot_dir.exists():
+        return []
+    return sorted(path.name for path in snapshot_dir.iterdir() if (path / AGGREGATE_NAME).exists())
+
+
+def _read_release_name(combined_path):
+    # Der Datenstand der ersten Zeile dient als Name des Snapshots
+    first_row = pd.read_csv(combined_path, dtype=str, nrows=1)
+    for col in ('Datenstand_x', 'Datenstand'):
+        if col in first_row.columns:
+            return first_row[col].iloc[0]
+    raise ValueError("Die Datei enthält keine Spalte 'Datenstand'. Bitte einen Namen für den Snapshot angeben.")
+
+
+def _load_known_hashes(row_store_path):
+    if not row_store_path.exists():
+        return set()
+    hashes = pd.read_csv(row_store_path, usecols=['zeilen_hash'], dtype={'zeilen_hash': 'uint64'})
+    return set(hashes['zeilen_hash'])
+
+
+def _add_dimensions(chunk, kanonische_namen):
+    # Ergänzt die Spalten aller Dimensionen, die nicht direkt in der Tabelle stehen
+    chunk = chunk.assign(
+        LadeleistungInKW=pd.to_numeric(chunk['LadeleistungInKW'], errors='coerce'),
+        BetreiberKanonisch=chunk['BetreiberBereinigt'].map(kanonische_namen),
+        Gesamt='Gesamt',
+    )
+    chunk['Leistungskategorie'] = get_leistungskategorie(chunk['LadeleistungInKW'])
+    return chunk
+
+
+def _chunk_aggregates(chunk, kanonische_namen):
+    # Teil-Aggregate eines Blocks je Dimension und Station. Eine Station kann über eine
+    # Blockgrenze hinweg verteilt sein, deshalb wird erst am Ende auf Stationen verdichtet.
+    chunk = _add_dimensions(chunk, kanonische_namen)
+
+    parts = []
+    for dimension, col in DIMENSIONS.items():
+        part = (
+            chunk.groupby([col, 'ladestation_id'])
+            .agg(Ladepunkte=('ladestation_id', 'size'), LeistungKW=('LadeleistungInKW', 'sum'))
+            .reset_index()
+            .rename(columns={col: 'Wert'})
+        )
+        part.insert(0, 'Dimension', dimension)
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def create_snapshot(release=None, combined_path=OUTPUT_PATH, snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE,
+                    mapping_path=MAPPING_PATH):
+    # Legt einen neuen Stand aus der kombinierten Tabelle an. Neue oder geänderte Zeilen
+    # werden an den Zeilenspeicher angehängt, unveränderte Zeilen nur im Manifest referenziert.
+    if release is None:
+        release = _read_release_name(combined_path)
+
+    release_dir = snapshot_dir / release
+    release_dir.mkdir(parents=True, exist_ok=True)
+    row_store_path = snapshot_dir / ROW_STORE_NAME
+
+    known_hashes = _load_known_hashes(row_store_path)
+    store_columns = None
+    if row_store_path.exists():
+        store_columns = list(pd.read_csv(row_store_path, nrows=0).columns)
+
+    # Betreiber werden über die Zuordnung aus operator_mapping.py zusammengefasst
+    betreiber = pd.read_csv(combined_path, usecols=['BetreiberBereinigt'], dtype=str)['BetreiberBereinigt']
+    kanonische_namen = update_mapping(betreiber, mapping_path).set_index('BetreiberBereinigt')['BetreiberKanonisch']
+
+    manifest_parts = []
+    aggregate_parts = []
+    new_rows = 0
+
+    for chunk in pd.read_csv(combined_path, dtype=str, chunksize=chunk_size):
+        rows = chunk.drop(columns=[col for col in VOLATILE_COLUMNS if col in chunk.columns])
+        hashes = pd.util.hash_pandas_object(rows, index=False)
+        rows.insert(0, 'zeilen_hash', hashes.to_numpy())
+
+        if store_columns is None:
+            store_columns = list(rows.columns)
+        elif set(rows.columns) != set(store_columns):
+            raise ValueError(
+                f"Die Spalten von '{release}' passen nicht zum bestehenden Zeilenspeicher. "
+                "Bitte einen neuen Snapshot-Ordner verwenden."
+            )
+
+        # Nur Zeilen speichern, die in keinem früheren Stand (oder früheren Block) vorkommen
+        is_new = ~rows['zeilen_hash'].isin(known_hashes) & ~rows['zeilen_hash'].duplicated()
+        if is_new.any():
+            rows.loc[is_new, store_columns].to_csv(
+                row_store_path, mode='a', header=not row_store_path.exists(), index=False
+            )
+            known_hashes.update(rows.loc[is_new, 'zeilen_hash'])
+            new_rows += int(is_new.sum())
+
+        # Identische Zeilen (z.B. gleiche Ladepunkte einer Station) werden gezählt statt wiederholt
+        manifest_parts.append(rows.groupby('zeilen_hash').size().rename('Anzahl'))
+        aggregate_parts.append(_chunk_aggregates(chunk, kanonische_namen))
+
+    manifest = pd.concat(manifest_parts).groupby(level=0).sum().reset_index()
+    manifest.to_csv(release_dir / MANIFEST_NAME, index=False)
+    _write_aggregates(aggregate_parts, release_dir / AGGREGATE_NAME)
+    _write_changes(release, snapshot_dir, kanonische_namen, chunk_size)
+
+    print(f"Snapshot '{release}' gespeichert: {int(manifest['Anzahl'].sum()):,} Zeilen, davon {new_rows:,} neu im Zeilenspeicher.")
+    return release
+
+
+def _write_aggregates(aggregate_parts, path):
+    # Verdichtet die Teil-Aggregate erst auf Stationen, dann auf die Werte jeder Dimension
+    per_station = (
+        pd.concat(aggregate_parts, ignore_index=True)
+        .groupby(['Dimension', 'Wert', 'ladestation_id'], as_index=False)
+        .sum()
+    )
+    aggregate = (
+        per_station.groupby(['Dimension', 'Wert'])
+        .agg(
+            Ladestationen=('ladestation_id', 'size'),
+            Ladepunkte=('Ladepunkte', 'sum'),
+            LeistungKW=('LeistungKW', 'sum'),
+        )
+        .reset_index()
+    )
+    aggregate['Version'] = AGGREGATE_VERSION
+    aggregate.to_csv(path, index=False)
+
+
+def _previous_release(release, snapshot_dir):
+    earlier = [name for name in list_snapshots(snapshot_dir) if name < release]
+    return earlier[-1] if earlier else None
+
+
+def _write_changes(release, snapshot_dir, kanonische_namen, chunk_size=CHUNK_SIZE):
+    # Zu- und Abgänge von Ladepunkten je Dimension gegenüber dem vorherigen Stand. Die Zeilen
+    # werden über ihren Hash im Manifest identifiziert; eine geänderte Zeile zählt als Abgang
+    # der alten und Zugang der neuen Fassung.
+    path = snapshot_dir / release / CHANGES_NAME
+    vorgaenger = _previous_release(release, snapshot_dir)
+    if vorgaenger is None:
+        path.unlink(missing_ok=True)
+        return
+
+    def read_manifest(name):
+        manifest = pd.read_csv(snapshot_dir / name / MANIFEST_NAME, dtype={'zeilen_hash': 'uint64'})
+        return manifest.set_index('zeilen_hash')['Anzahl']
+
+    alt, neu = read_manifest(vorgaenger).align(read_manifest(release), join='outer', fill_value=0)
+    differenz = (neu - alt)[neu != alt]
+
+    # Nur die geänderten Zeilen aus dem Zeilenspeicher lesen
+    parts = []
+    if not differenz.empty:
+        reader = pd.read_csv(snapshot_dir / ROW_STORE_NAME, dtype=str, chunksize=chunk_size)
+        for chunk in reader:
+            hashes = chunk['zeilen_hash'].astype('uint64')
+            chunk = chunk[hashes.isin(differenz.index)]
+            if chunk.empty:
+                continue
+            chunk = _add_dimensions(chunk, kanonische_namen)
+            anzahl = differenz.loc[chunk['zeilen_hash'].astype('uint64')].to_numpy()
+            chunk['Zugang_Ladepunkte'] = anzahl.clip(min=0)
+            chunk['Abgang_Ladepunkte'] = (-anzahl).clip(min=0)
+            for dimension, col in DIMENSIONS.items():
+                part = (
+                    chunk.groupby(col)[['Zugang_Ladepunkte', 'Abgang_Ladepunkte']].sum()
+                    .rename_axis('Wert').reset_index()
+                )
+                part.insert(0, 'Dimension', dimension)
+                parts.append(part)
+
+    # Die Zeile 'Gesamt' gibt es immer, damit der Vorgänger auch ohne Änderungen vermerkt ist
+    parts.append(pd.DataFrame({'Dimension': ['Gesamt'], 'Wert': ['Gesamt'], 'Zugang_Ladepunkte': [0], 'Abgang_Ladepunkte': [0]}))
+    changes = pd.concat(parts, ignore_index=True).groupby(['Dimension', 'Wert'], as_index=False).sum()
+    changes['Vorgaenger'] = vorgaenger
+    changes.to_csv(path, index=False)
+
+
+def _load_changes(release_alt, release_neu, dimension, snapshot_dir):
+    # Summiert die Zu- und Abgänge aller Schritte von 'release_alt' bis 'release_neu'.
+    # Ist die Kette der Vorgänger unterbrochen, gibt es keine Zu- und Abgänge (None).
+    parts = []
+    release = release_neu
+    while release != release_alt:
+        path = snapshot_dir / release / CHANGES_NAME
+        if release < release_alt or not path.exists():
+            return None
+        changes = pd.read_csv(path)
+        parts.append(changes[changes['Dimension'] == dimension])
+        release = changes['Vorgaenger'].iloc[0]
+
+    if not parts:
+        return pd.DataFrame(columns=['Zugang_Ladepunkte', 'Abgang_Ladepunkte'])
+    return pd.concat(parts).groupby('Wert')[['Zugang_Ladepunkte', 'Abgang_Ladepunkte']].sum()
+
+
+def load_snapshot(release, snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE):
+    # Stellt die Zeilen eines Stands aus Manifest und Zeilenspeicher wieder her
+    manifest = pd.read_csv(snapshot_dir / release / MANIFEST_NAME, dtype={'zeilen_hash': 'uint64'})
+    anzahl = manifest.set_index('zeilen_hash')['Anzahl']
+
+    parts = []
+    reader = pd.read_csv(snapshot_dir / ROW_STORE_NAME, dtype=str, chunksize=chunk_size)
+    for chunk in reader:
+        hashes = chunk['zeilen_hash'].astype('uint64')
+        selected = chunk[hashes.isin(anzahl.index)]
+        repeats = anzahl.loc[selected['zeilen_hash'].astype('uint64')].to_numpy()
+        parts.append(selected.loc[selected.index.repeat(repeats)])
+
+    return pd.concat(parts, ignore_index=True).drop(columns='zeilen_hash')
+
+
+def aggregate_version(release, snapshot_dir=SNAPSHOT_DIR):
+    # Aggregate ohne Spalte 'Version' stammen aus der ersten Fassung
+    header = pd.read_csv(snapshot_dir / release / AGGREGATE_NAME, nrows=1)
+    return int(header['Version'].iloc[0]) if 'Version' in header.columns else 1
+
+
+def load_aggregates(release, snapshot_dir=SNAPSHOT_DIR):
+    version = aggregate_version(release, snapshot_dir)
+    if version != AGGREGATE_VERSION:
+        raise ValueError(
+            f"Die Aggregate von '{release}' haben Version {version}, erwartet wird Version {AGGREGATE_VERSION}. "
+            "Bitte 'python 01_app/snapshots.py' ausführen, um sie neu zu berechnen."
+        )
+    return pd.read_csv(snapshot_dir / release / AGGREGATE_NAME)
+
+
+def rebuild_aggregates(release, snapshot_dir=SNAPSHOT_DIR, mapping_path=MAPPING_PATH):
+    # Berechnet die Aggregate eines Stands aus dem Zeilenspeicher neu (z.B. nach einer
+    # Änderung der Aggregat-Version). Manifest und Zeilenspeicher bleiben unverändert.
+    rows = load_snapshot(release, snapshot_dir)
+    kanonische_namen = update_mapping(rows['BetreiberBereinigt'], mapping_path).set_index('BetreiberBereinigt')['BetreiberKanonisch']
+    _write_aggregates([_chunk_aggregates(rows, kanonische_namen)], snapshot_dir / release / AGGREGATE_NAME)
+    _write_changes(release, snapshot_dir, kanonische_namen)
+    print(f"Aggregate von '{release}' neu berechnet.")
+
+
+def compare_snapshots(release_alt, release_neu, dimension, snapshot_dir=SNAPSHOT_DIR):
+    # Veränderung je Kreis, Betreiber oder Leistungskategorie zwischen zwei Ständen.
+    # Es werden nur die vorberechneten Aggregate gelesen, kein zeilenweiser Vergleich.
+    # Zu- und Abgänge werden über alle Zwischenstände summiert; fehlt ein Schritt, sind sie leer.
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unbekannte Dimension '{dimension}'. Erlaubt sind: {', '.join(DIMENSIONS)}.")
+
+    kennzahlen = ['Ladestationen', 'Ladepunkte', 'LeistungKW']
+    alt = load_aggregates(release_alt, snapshot_dir)
+    neu = load_aggregates(release_neu, snapshot_dir)
+    alt = alt[alt['Dimension'] == dimension].set_index('Wert')[kennzahlen]
+    neu = neu[neu['Dimension'] == dimension].set_index('Wert')[kennzahlen]
+
+    # Werte, die nur in einem der beiden Stände vorkommen, zählen dort als 0
+    alt, neu = alt.align(neu, join='outer', fill_value=0)
+    delta = (neu - alt).add_prefix('Delta_')
+
+    result = pd.concat([alt.add_suffix('_alt'), neu.add_suffix('_neu'), delta], axis=1)
+    changes = _load_changes(release_alt, release_neu, dimension, snapshot_dir)
+    if changes is None:
+        result['Zugang_Ladepunkte'] = np.nan
+        result['Abgang_Ladepunkte'] = np.nan
+    else:
+        result = result.join(changes, how='outer')
+        result[['Zugang_Ladepunkte', 'Abgang_Ladepunkte']] = result[['Zugang_Ladepunkte', 'Abgang_Ladepunkte']].fillna(0)
+    result.index.name = dimension
+    return result.sort_values('Delta_Ladepunkte', ascending=False).reset_index()
+
+
+if __name__ == "__main__":
+    create_snapshot()
+    # Ältere Stände auf die aktuelle Aggregat-Version bringen, damit sie vergleichbar bleiben
+    for release in list_snapshots():
+        if aggregate_version(release) != AGGREGATE_VERSION:
+            rebuild_aggregates(release)